@@ -3,22 +3,250 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.edge.options import Options
+from lxml import etree
+from lxml import html as lxml_html
+import requests
+import atexit
+import functools
 import json
 import logging
+import os
+import queue
 import re
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
+
+# orjson（Rust实现）序列化快3-10倍，未安装时退回标准库
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    _json_loads = json.loads
+
+# 预编译正则，避免每行设备都经过re模块的缓存查找
+_MAC_STRIP = re.compile(r"[^0-9A-Fa-f]")
+_LEASE_RE = re.compile(r"(\d+)\s*(hour|min|sec)", re.IGNORECASE)
+
+# 登录会话缓存，sid未过期时可以完全跳过浏览器（按光猫地址分文件）
+_SESSION_DIR = Path.home() / ".nokia_tracker"
+
+
+def _build_edge_options(headless):
+    """构建Edge启动参数"""
+    options = Options()
+    if headless:
+        options.add_argument("--headless")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--window-size=1920,1080")
+    # 数据提取用不到图片和样式，省去这部分传输和渲染
+    options.add_experimental_option(
+        "prefs",
+        {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.stylesheets": 2,
+        },
+    )
+    # DOMContentLoaded即返回，不等页面全部资源加载完
+    options.page_load_strategy = "eager"
+    return options
+
+
+def _create_edge_driver(options):
+    """启动Edge并注入反自动化检测脚本"""
+    driver = webdriver.Edge(options=options)
+    # 禁用自动化检测特征
+    driver.execute_cdp_cmd(
+        "Page.addScriptToEvaluateOnNewDocument",
+        {
+            "source": """
+                Object.defineProperty(navigator, 'webdriver', {
+                    get: () => undefined
+                })
+            """
+        },
+    )
+    # 开启CDP网络域（登录时从CDP读cookie），并拦截静态资源请求
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd(
+        "Network.setBlockedURLs",
+        {"urls": ["*.png", "*.jpg", "*.gif", "*.ico", "*.woff*"]},
+    )
+    return driver
+
+
+@functools.lru_cache(maxsize=1024)
+def _format_mac(raw_mac):
+    """统一MAC地址格式（同一批MAC反复出现，缓存后只需一次字典查找）"""
+    if not raw_mac:
+        return ""
+
+    # 光猫一般直接返回规范的冒号分隔格式，这种情况不用动用正则
+    mac = raw_mac.strip().upper()
+    if len(mac) == 17 and mac[2] == ":" and mac.count(":") == 5:
+        return mac
+
+    mac = _MAC_STRIP.sub("", mac)
+    return (
+        ":".join(mac[i : i + 2] for i in range(0, 12, 2))
+        if len(mac) == 12
+        else raw_mac
+    )
+
+
+def _parse_lease_time(lease_str):
+    """将租约时间转为秒数"""
+    try:
+        # 空单元格或"—"之类的占位文本直接返回，不进正则引擎
+        if not any(c.isdigit() for c in lease_str):
+            return lease_str.strip()
+
+        total = 0
+        time_map = {"hour": 3600, "min": 60, "sec": 1}
+        for match in _LEASE_RE.finditer(lease_str):
+            value, unit = match.groups()
+            total += int(value) * time_map[unit.lower()]
+        return total
+    except:
+        return lease_str.strip()
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_datetime(dt_str):
+    """解析光猫的 MM/DD/YYYY HH:MM:SS AM/PM 时间戳为ISO格式
+
+    手工拆分比datetime.strptime快一个数量级，轮询时相同时间戳还能命中缓存；
+    无法解析时原样返回。
+    """
+    try:
+        date_part, time_part, ampm = dt_str.split()
+        month, day, year = date_part.split("/")
+        hour, minute, second = time_part.split(":")
+
+        hour = int(hour) % 12
+        if ampm.upper() == "PM":
+            hour += 12
+
+        return datetime(
+            int(year), int(month), int(day), hour, int(minute), int(second)
+        ).isoformat(sep=" ")
+    except (ValueError, AttributeError):
+        return dt_str
+
+
+def _parse_device_row_from_html(cells):
+    """将一行表格的单元格文本转为设备信息字典"""
+    if len(cells) < 8:
+        return None
+
+    return {
+        "status": cells[0],
+        "connection_type": cells[1],
+        "name": cells[2],
+        "ip_address": cells[3],
+        "mac_address": _format_mac(cells[4]),
+        "allocation": cells[5],
+        "lease_remaining": _parse_lease_time(cells[6]),
+        "last_active": _parse_datetime(cells[7]),
+    }
+
+
+class DeviceSource:
+    """设备数据来源：默认走JS变量，HTML解析只用于备用和离线回放"""
+
+    @staticmethod
+    def from_js(driver):
+        """从页面JS变量device_cfg提取（数据已结构化，无需解析HTML）"""
+        devices_js = driver.execute_script("return JSON.stringify(device_cfg)")
+        devices_data = _json_loads(devices_js)
+
+        return [
+            {
+                "status": "Active" if device.get("Active") else "Inactive",
+                "connection_type": device.get("InterfaceType", "Unknown"),
+                "name": device.get("HostName", "Unknown"),
+                "ip_address": device.get("IPAddress", ""),
+                "mac_address": _format_mac(device.get("MACAddress", "")),
+                "allocation": device.get("AddressSource", "Unknown"),
+                "lease_remaining": device.get("LeaseTimeRemaining", 0),
+                "last_active": _parse_datetime(
+                    device.get("X_ALU_COM_LastActiveTime", "")
+                ),
+            }
+            for device in devices_data
+        ]
+
+    @staticmethod
+    def from_html(html_content):
+        """从LAN状态页HTML中提取设备列表"""
+        # 直接用lxml+XPath提取，整个过程都在C层完成
+        doc = lxml_html.fromstring(html_content)
+        rows = doc.xpath('//tbody[@id="devicelist"]/tr')
+        if not rows:
+            return None
+
+        devices = []
+        for row in rows[1:]:  # 跳过表头
+            cells = [td.text_content().strip() for td in row.xpath("td")]
+            device = _parse_device_row_from_html(cells)
+            if device:
+                devices.append(device)
+
+        return devices
+
+    @staticmethod
+    def from_html_file(html_path):
+        """流式解析保存的HTML文件，峰值内存与页面大小无关"""
+        devices = []
+        in_devlist = False
+        header_skipped = False
+
+        # 调试转储按UTF-8写出且没有charset声明，必须显式指定编码
+        for event, elem in etree.iterparse(
+            html_path, events=("start", "end"), html=True, encoding="utf-8"
+        ):
+            if event == "start":
+                if elem.tag == "tbody" and elem.get("id") == "devicelist":
+                    in_devlist = True
+                continue
+
+            # 设备表格结束后页面剩余部分不用再看
+            if elem.tag == "tbody" and elem.get("id") == "devicelist":
+                break
+
+            if in_devlist and elem.tag == "tr":
+                if not header_skipped:  # 跳过表头
+                    header_skipped = True
+                else:
+                    cells = ["".join(td.itertext()).strip() for td in elem.iter("td")]
+                    device = _parse_device_row_from_html(cells)
+                    if device:
+                        devices.append(device)
+
+                # 及时释放已处理的节点，保持内存有界
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+
+        return devices or None
 
 
 class NokiaG240GDeviceTracker:
-    def __init__(self, headless=False):
-        self.options = Options()
-        if headless:
-            self.options.add_argument("--headless")
-        self.options.add_argument("--disable-gpu")
-        self.options.add_argument("--window-size=1920,1080")
+    def __init__(self, headless=False, base_url="http://192.168.10.254"):
+        self.options = _build_edge_options(headless)
         self.driver = None
-        self.base_url = "http://192.168.10.254"
+        self.base_url = base_url
+
+        host = base_url.split("//", 1)[-1].replace(":", "_")
+        self._session_file = _SESSION_DIR / f"session_{host}.json"
+
+        # 调试目录提前建好，保存调试信息时不再依赖目录已存在
+        self._debug_dir = Path("debug")
+        self._debug_dir.mkdir(parents=True, exist_ok=True)
 
         # 配置日志
         logging.basicConfig(
@@ -30,21 +258,20 @@ class NokiaG240GDeviceTracker:
             ],
         )
 
+    def __enter__(self):
+        # 驱动按需初始化：缓存会话命中时完全不用启动浏览器
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
     def init_driver(self):
         """初始化浏览器驱动"""
         logging.info("Initializing Edge browser...")
-        self.driver = webdriver.Edge(options=self.options)
-        # 禁用自动化检测特征
-        self.driver.execute_cdp_cmd(
-            "Page.addScriptToEvaluateOnNewDocument",
-            {
-                "source": """
-                    Object.defineProperty(navigator, 'webdriver', {
-                        get: () => undefined
-                    })
-                """
-            },
-        )
+        self.driver = _create_edge_driver(self.options)
+        # 进程异常退出时也要回收driver，避免残留msedgedriver进程
+        atexit.register(self.close)
 
     def login(self, username, password):
         """执行登录流程"""
@@ -63,19 +290,28 @@ class NokiaG240GDeviceTracker:
 
             username_field.clear()
             username_field.send_keys(username)
-            time.sleep(1)
             password_field.clear()
             password_field.send_keys(password)
-            time.sleep(1)
 
             # 提交表单
             self.driver.find_element(By.ID, "loginBT").click()
 
-            # 验证登录成功
+            # 验证登录成功：CDP读cookie比WebDriver的get_cookie轮询开销小
             WebDriverWait(self.driver, 10).until(
-                lambda d: d.get_cookie("sid") is not None
+                lambda d: any(
+                    c["name"] == "sid"
+                    for c in d.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+                )
             )
             logging.info("Login successful")
+
+            # 缓存sid，下次运行可以直接走HTTP
+            cookies = self.driver.execute_cdp_cmd("Network.getAllCookies", {})[
+                "cookies"
+            ]
+            sid = next((c["value"] for c in cookies if c["name"] == "sid"), None)
+            if sid:
+                self._save_session(sid)
             return True
 
         except Exception as e:
@@ -87,27 +323,7 @@ class NokiaG240GDeviceTracker:
         """获取设备列表（从JS变量直接提取）"""
         try:
             logging.info("Extracting device data from JavaScript...")
-
-            # 获取原始设备数据
-            devices_js = self.driver.execute_script("return JSON.stringify(device_cfg)")
-            devices_data = json.loads(devices_js)
-
-            # 格式化设备信息
-            formatted_devices = []
-            for device in devices_data:
-                formatted_devices.append(
-                    {
-                        "status": "Active" if device.get("Active") else "Inactive",
-                        "connection_type": device.get("InterfaceType", "Unknown"),
-                        "name": device.get("HostName", "Unknown"),
-                        "ip_address": device.get("IPAddress", ""),
-                        "mac_address": self._format_mac(device.get("MACAddress", "")),
-                        "allocation": device.get("AddressSource", "Unknown"),
-                        "lease_remaining": device.get("LeaseTimeRemaining", 0),
-                        "last_active": device.get("X_ALU_COM_LastActiveTime", ""),
-                    }
-                )
-
+            formatted_devices = DeviceSource.from_js(self.driver)
             logging.info(f"Found {len(formatted_devices)} devices")
             return formatted_devices
 
@@ -115,10 +331,82 @@ class NokiaG240GDeviceTracker:
             logging.error(f"Failed to extract devices: {str(e)}")
             self._save_debug_info("device_extract_failure")
 
-            # 回退到DOM解析
+            # 优先用HTTP直接拉取，失败再回退DOM解析
+            logging.info("Attempting HTTP fallback...")
+            devices = self._get_devices_via_http()
+            if devices:
+                return devices
+
             logging.info("Attempting DOM fallback...")
             return self._get_devices_from_dom()
 
+    def get_devices_with_cached_session(self):
+        """尝试用上次缓存的sid直接通过HTTP获取设备列表"""
+        sid = self._load_cached_sid()
+        if not sid:
+            return None
+
+        try:
+            response = requests.get(
+                f"{self.base_url}/lan_status.cgi?wlan",
+                cookies={"sid": sid},
+                timeout=10,
+            )
+            response.raise_for_status()
+
+            # 会话过期时光猫会返回登录页
+            if "loginform" in response.text:
+                logging.info("Cached session expired")
+                self._invalidate_session()
+                return None
+
+            devices = DeviceSource.from_html(response.text)
+            if devices is None:
+                self._invalidate_session()
+                return None
+
+            logging.info(f"Cached session hit, found {len(devices)} devices")
+            return devices
+
+        except Exception as e:
+            logging.warning(f"Cached session fetch failed: {str(e)}")
+            return None
+
+    def _save_session(self, sid):
+        """持久化登录会话"""
+        try:
+            self._session_file.parent.mkdir(parents=True, exist_ok=True)
+            self._session_file.write_text(
+                json.dumps({"sid": sid, "obtained_at": time.time()})
+            )
+        except OSError as e:
+            logging.warning(f"Could not cache session: {str(e)}")
+
+    def _load_cached_sid(self):
+        """读取缓存的sid，不存在或损坏时返回None"""
+        try:
+            return _json_loads(self._session_file.read_text()).get("sid")
+        except (OSError, ValueError):
+            return None
+
+    def _invalidate_session(self):
+        """清除失效的会话缓存"""
+        self._session_file.unlink(missing_ok=True)
+
+    def _get_devices_via_http(self):
+        """复用登录cookie，用requests单次请求拉取设备页面（备用方案）"""
+        try:
+            cookies = {c["name"]: c["value"] for c in self.driver.get_cookies()}
+            response = requests.get(
+                f"{self.base_url}/lan_status.cgi?wlan", cookies=cookies, timeout=10
+            )
+            response.raise_for_status()
+            return DeviceSource.from_html(response.text)
+
+        except Exception as e:
+            logging.error(f"HTTP fallback failed: {str(e)}")
+            return None
+
     def _get_devices_from_dom(self):
         """从DOM表格获取设备列表（备用方案）"""
         try:
@@ -127,26 +415,20 @@ class NokiaG240GDeviceTracker:
                 EC.presence_of_element_located((By.ID, "devicelist"))
             )
 
+            # 一次execute_script取回整张表格，避免每个单元格一次WebDriver往返
+            table_data = self.driver.execute_script(
+                "return Array.from(document.querySelectorAll('#devicelist tr'))"
+                ".slice(1)"  # 跳过表头
+                ".map(r => Array.from(r.querySelectorAll('td'))"
+                ".map(c => c.innerText));"
+            )
+
             devices = []
-            rows = self.driver.find_elements(By.CSS_SELECTOR, "#devicelist tr")
-
-            for row in rows[1:]:  # 跳过表头
-                cols = row.find_elements(By.TAG_NAME, "td")
-                if len(cols) < 8:
-                    continue
-
-                devices.append(
-                    {
-                        "status": cols[0].text.strip(),
-                        "connection_type": cols[1].text.strip(),
-                        "name": cols[2].text.strip(),
-                        "ip_address": cols[3].text.strip(),
-                        "mac_address": self._format_mac(cols[4].text),
-                        "allocation": cols[5].text.strip(),
-                        "lease_remaining": self._parse_lease_time(cols[6].text),
-                        "last_active": cols[7].text.strip(),
-                    }
-                )
+            for row in table_data:
+                cells = [cell.strip() for cell in row]
+                device = _parse_device_row_from_html(cells)
+                if device:
+                    devices.append(device)
 
             logging.info(f"DOM fallback found {len(devices)} devices")
             return devices
@@ -155,43 +437,34 @@ class NokiaG240GDeviceTracker:
             logging.error(f"DOM fallback failed: {str(e)}")
             return None
 
-    def _format_mac(self, raw_mac):
-        """统一MAC地址格式"""
-        if not raw_mac:
-            return ""
-        mac = re.sub(r"[^0-9A-Fa-f]", "", raw_mac)
-        return (
-            ":".join(mac[i : i + 2] for i in range(0, 12, 2))
-            if len(mac) == 12
-            else raw_mac
-        )
-
-    def _parse_lease_time(self, lease_str):
-        """将租约时间转为秒数"""
+    def get_device_list_from_file(self, html_path):
+        """从保存的HTML文件解析设备列表（离线回放调试转储）"""
         try:
-            total = 0
-            time_map = {"hour": 3600, "min": 60, "sec": 1}
-            for match in re.finditer(
-                r"(\d+)\s*(hour|min|sec)", lease_str, re.IGNORECASE
-            ):
-                value, unit = match.groups()
-                total += int(value) * time_map[unit.lower()]
-            return total
-        except:
-            return lease_str.strip()
+            devices = DeviceSource.from_html_file(html_path)
+            if devices is None:
+                logging.warning(f"No devicelist table found in {html_path}")
+                return None
+
+            logging.info(f"Parsed {len(devices)} devices from {html_path}")
+            return devices
+
+        except Exception as e:
+            logging.error(f"Failed to parse {html_path}: {str(e)}")
+            return None
 
     def _save_debug_info(self, scenario):
         """保存调试信息"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         try:
             # 保存截图
-            self.driver.save_screenshot(f"debug/{scenario}_{timestamp}.png")
-            # 保存页面源码
-            with open(f"debug/{scenario}_{timestamp}.html", "w", encoding="utf-8") as f:
-                f.write(self.driver.page_source)
-            # 保存JS上下文
-            with open(f"debug/{scenario}_{timestamp}.json", "w") as f:
-                f.write(self.driver.execute_script("return JSON.stringify(window)"))
+            self.driver.save_screenshot(
+                str(self._debug_dir / f"{scenario}_{timestamp}.png")
+            )
+
+            # 整页源码要跨WebDriver桥拷贝整个DOM，默认不保存
+            if os.environ.get("TRACKER_FULL_DEBUG"):
+                html_file = self._debug_dir / f"{scenario}_{timestamp}.html"
+                html_file.write_text(self.driver.page_source, encoding="utf-8")
         except Exception as e:
             logging.error(f"Could not save debug info: {str(e)}")
 
@@ -199,46 +472,130 @@ class NokiaG240GDeviceTracker:
         """关闭浏览器"""
         if self.driver:
             self.driver.quit()
+            self.driver = None
             logging.info("Browser closed")
 
 
-def main():
-    tracker = NokiaG240GDeviceTracker(headless=False)
+class DriverPool:
+    """有界WebDriver池：预启动N个Edge实例，供并发抓取任务复用"""
+
+    def __init__(self, size=2, headless=True):
+        self._queue = queue.Queue(maxsize=size)
+        self._drivers = []
+        options = _build_edge_options(headless)
+        for _ in range(size):
+            driver = _create_edge_driver(options)
+            self._drivers.append(driver)
+            self._queue.put(driver)
+        # 进程退出时统一回收，避免残留msedgedriver进程
+        atexit.register(self.shutdown)
+
+    def acquire(self):
+        """取出一个空闲driver，池空时阻塞等待"""
+        return self._queue.get()
+
+    def release(self, driver):
+        """归还driver供后续任务复用"""
+        self._queue.put(driver)
+
+    def shutdown(self):
+        """关闭池中所有driver"""
+        while self._drivers:
+            driver = self._drivers.pop()
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+
+def scrape_routers(routers, max_workers=2):
+    """并发抓取多台光猫，返回{base_url: 设备列表}
+
+    routers为(base_url, username, password)元组的列表。
+    """
+    pool = DriverPool(size=max_workers, headless=True)
+
+    def scrape(router):
+        base_url, username, password = router
+        tracker = NokiaG240GDeviceTracker(base_url=base_url)
+        tracker.driver = pool.acquire()
+        try:
+            if not tracker.login(username, password):
+                return base_url, None
+            return base_url, tracker.get_device_list()
+        finally:
+            pool.release(tracker.driver)
+            tracker.driver = None
+
     try:
-        tracker.init_driver()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(executor.map(scrape, routers))
+    finally:
+        pool.shutdown()
+
+
+# 摘要行模板只构建一次，逐台设备直接format_map填充
+_SUMMARY_ROW = (
+    "{status:<8}{name:<20}{ip_address:<15}{mac_address:<20}"
+    "{connection_type:<12}{last_active:<25}"
+)
 
-        if tracker.login("admin", "FC5B3132"):
-            devices = tracker.get_device_list()
-            if devices:
-                print("\nConnected Devices:")
-                print("-" * 120)
-                print(
-                    f"{'Status':<8}{'Name':<20}{'IP Address':<15}{'MAC Address':<20}{'Type':<12}{'Last Active':<25}"
-                )
-                print("-" * 120)
-                for device in devices:
-                    print(
-                        f"{device['status']:<8}"
-                        f"{device['name']:<20}"
-                        f"{device['ip_address']:<15}"
-                        f"{device['mac_address']:<20}"
-                        f"{device['connection_type']:<12}"
-                        f"{device['last_active']:<25}"
-                    )
-
-                # 保存完整报告
-                with open("device_report.json", "w") as f:
-                    json.dump(devices, f, indent=2)
-                logging.info("Report saved to device_report.json")
-            else:
-                logging.warning("No devices found")
-        else:
-            logging.error("Login failed")
+
+def report_devices(devices):
+    """打印设备摘要并保存完整报告"""
+    separator = "-" * 120
+    lines = [
+        "",
+        "Connected Devices:",
+        separator,
+        f"{'Status':<8}{'Name':<20}{'IP Address':<15}{'MAC Address':<20}{'Type':<12}{'Last Active':<25}",
+        separator,
+    ]
+    lines.extend(_SUMMARY_ROW.format_map(device) for device in devices)
+
+    # 整块一次写出，避免每行一次stdout写入并防止与日志输出交错
+    sys.stdout.write("\n".join(lines) + "\n")
+
+    if orjson is not None:
+        with open("device_report.json", "wb") as f:
+            f.write(orjson.dumps(devices, option=orjson.OPT_INDENT_2))
+    else:
+        with open("device_report.json", "w") as f:
+            json.dump(devices, f, indent=2)
+    logging.info("Report saved to device_report.json")
+
+
+def main():
+    # --interval N: 定时监控模式，复用同一个浏览器会话轮询
+    interval = None
+    if len(sys.argv) > 2 and sys.argv[1] == "--interval":
+        interval = int(sys.argv[2])
+
+    try:
+        with NokiaG240GDeviceTracker(headless=False) as tracker:
+            while True:
+                # 缓存会话命中时完全不需要浏览器
+                devices = tracker.get_devices_with_cached_session()
+
+                if devices is None:
+                    if tracker.driver is None:
+                        tracker.init_driver()
+                        if not tracker.login("admin", "FC5B3132"):
+                            logging.error("Login failed")
+                            return
+                    devices = tracker.get_device_list()
+
+                if devices:
+                    report_devices(devices)
+                else:
+                    logging.warning("No devices found")
+
+                if interval is None:
+                    break
+                time.sleep(interval)
 
     except Exception as e:
         logging.critical(f"Fatal error: {str(e)}", exc_info=True)
-    finally:
-        tracker.close()
 
 
 if __name__ == "__main__":